@@ -28,16 +28,27 @@ iPhone照片讀取程式 (修正版本)
 """
 
 import os
+import re
+import argparse
+import asyncio
 import sys
 import json
+import mmap
 import threading
 import signal
+import socket
+import queue
+from array import array
+from collections import OrderedDict
+from contextlib import ExitStack
+from io import BytesIO
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import time
 
 try:
+    from pymobiledevice3 import usbmux
     from pymobiledevice3.lockdown import create_using_usbmux
     from pymobiledevice3.services.afc import AfcService
     from pymobiledevice3.services.house_arrest import HouseArrestService
@@ -49,25 +60,389 @@ except ImportError as e:
     print("請安裝最新版本: pip install pymobiledevice3")
     sys.exit(1)
 
+# 下載記錄優先存入SQLite，無法使用時改用JSON文件
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# fcntl只在POSIX系統上存在，用於macOS的F_NOCACHE
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 進度條為可選依賴，未安裝tqdm時退回單行文字進度
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# 可選的uvloop事件循環，排程大量下載任務時開銷較低；Windows上不支援
+uvloop = None
+if sys.platform != 'win32':
+    try:
+        import uvloop
+    except ImportError:
+        pass
+
 import logging
+import logging.handlers
 
-# 設定詳細日誌
+# 設定詳細日誌：記錄只放入隊列，由背景線程寫到終端和日誌文件，
+# 下載線程不必等待日誌的鎖和磁碟寫入
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.StreamHandler(),
+    logging.FileHandler('iphone_reader.log', encoding='utf-8')
+)
 logging.basicConfig(
     level=logging.INFO, 
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('iphone_reader.log', encoding='utf-8')
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
+_log_listener.start()
 logger = logging.getLogger(__name__)
 
+# 啟動時決定是否輸出debug日誌，熱路徑中據此跳過訊息格式化
+_DEBUG = logger.isEnabledFor(logging.DEBUG)
+
+# 媒體文件副檔名，str.endswith可直接接受tuple
+_MEDIA_EXT = (
+    # 圖片格式
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif',
+    '.heic', '.heif', '.webp', '.raw', '.dng', '.cr2', '.nef',
+    # 影片格式
+    '.mov', '.mp4', '.avi', '.mkv', '.m4v', '.3gp', '.wmv',
+    '.flv', '.webm', '.mpg', '.mpeg'
+)
+
+# AFC每次讀取的大小：大塊連續讀取減少USB往返，小於AFC_SMALL_FILE的文件一次讀完
+AFC_CHUNK = 2 << 20
+AFC_SMALL_FILE = 256 << 10
+
+# 本地文件以os.open直接寫入，略過Python文件對象的緩衝
+_LOCAL_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+# 不小於此大小的文件寫完後寫回磁碟並從頁面快取中丟棄
+_NOCACHE_THRESHOLD = 8 << 20
+
+# 內核內複製：Linux有copy_file_range和sendfile，其他平台退回os.read/os.write。
+# macOS/BSD的sendfile只能寫入socket，且不接受None作為偏移量，因此只在Linux上使用
+_copy_file_range = getattr(os, 'copy_file_range', None)
+_sendfile = getattr(os, 'sendfile', None) if sys.platform.startswith('linux') else None
+
+# 下載記錄的位置，多台設備共用一份，以UDID區分
+_MANIFEST_PATH = Path.home() / '.iphone_reader_manifest.sqlite'
+
+# 下載結束時的統計，中斷和完成共用，只有開頭的標題不同
+_SUMMARY_TMPL = "{banner}\n✓ 成功: {d} 個文件\n✗ 失敗: {f} 個文件\n⏱ 耗時: {e:.1f} 秒\n"
+_FAILURE_HINT_TMPL = "💡 有 {f} 個文件下載失敗，可能原因:\n   - 文件被系統保護\n   - 網路連接問題\n   - 存儲空間不足\n"
+_SKIPPED_TMPL = "⏭ 跳過: {n} 個先前已下載的文件 (使用 --force 重新下載)\n"
+
+# 固定不變的提示訊息，匯入時預先編碼為UTF-8，由_emit直接寫入stdout的位元組層
+def _static(text):
+    return text, text.encode('utf-8')
+
+_MSG_BANNER = _static("🍎 iPhone 15 Pro Max 照片讀取程式 (穩定版)\n🔧 專為iOS 18.5優化，修正模組相容性問題\n" + "=" * 60 + "\n")
+_MSG_TIP = _static("\n💡 使用提示: 操作過程中隨時按 Ctrl+C 可以中斷操作\n")
+_MSG_PARALLEL = _static("🔧 此版本使用有限併發的並行處理，兼顧速度與穩定性\n\n")
+_MSG_ANALYZING = _static("🔍 開始分析iPhone照片庫...\n")
+_MSG_REANALYZING = _static("\n🔄 重新分析照片庫...\n")
+_MSG_NO_MEDIA = _static("\n❌ 無法分析照片庫或未找到媒體文件\n建議:\n1. 確認iPhone上有照片\n2. 檢查iPhone信任設定\n3. 嘗試重新連接設備\n")
+_MSG_MENU = _static("\n選擇下載選項:\n1. 下載所有文件\n2. 只下載照片\n3. 只下載影片\n4. 重新分析\n5. 退出\n")
+_MSG_ANALYSIS_STOPPED = _static("\n🛑 分析已中斷\n")
+_MSG_OP_STOPPED = _static("\n🛑 操作已中斷\n")
+_MSG_STOP_SIGNAL = _static("\n\n⚠️  檢測到中斷信號 (Ctrl+C)\n正在安全停止操作...\n")
+_MSG_DOWNLOAD_TIP = _static("💡 按 Ctrl+C 可隨時中斷下載\n")
+_MSG_PROGRAM_STOPPED = _static("\n\n🛑 程式已中斷\n感謝使用!\n")
+_MSG_TROUBLESHOOT = _static(
+    "請檢查日誌文件: iphone_reader.log\n"
+    "\n故障排除建議:\n"
+    "1. 確認iPhone已連接並信任此電腦\n"
+    "2. 嘗試重新啟動iPhone和電腦\n"
+    "3. 更新pymobiledevice3: pip install --upgrade pymobiledevice3\n"
+    "4. 檢查USB線和連接埠\n"
+)
+
+def _emit(message):
+    """輸出_static建立的訊息，略過文字層的逐次編碼
+    
+    stdout不是UTF-8（如Windows舊主控台）或已被換成沒有buffer的對象時退回文字輸出。
+    先清空文字層的緩衝以保持與print的先後順序；終端機上與print一樣立即顯示。
+    """
+    text, data = message
+    stdout = sys.stdout
+    buffer = getattr(stdout, 'buffer', None)
+    if buffer is None or (getattr(stdout, 'encoding', None) or '').lower().replace('-', '') != 'utf8':
+        stdout.write(text)
+        stdout.flush()
+        return
+    stdout.flush()
+    buffer.write(data)
+    if getattr(stdout, 'line_buffering', False):
+        buffer.flush()
+
+# 文件類型分類
+_IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.heic', '.heif', '.webp', '.raw', '.dng'})
+_VIDEO_EXTS = frozenset({'.mov', '.mp4', '.avi', '.mkv', '.m4v', '.3gp', '.wmv'})
+
+# 判斷候選目錄是否與照片相關：照片副檔名、IMG_/DSC_開頭或含apple（如100APPLE）
+_PHOTO_HINT = re.compile(r'\.(?:jpe?g|png|heic|mov|mp4)$|^(?:img_|dsc_)|apple', re.IGNORECASE)
+
+def _to_timestamp(value):
+    """將AFC返回的時間（datetime或數字）轉為Unix時間戳"""
+    if hasattr(value, 'timestamp'):
+        return value.timestamp()
+    return float(value or 0)
+
+class PhotoCatalog:
+    """照片掃描結果，逐筆寫入NDJSON暫存文件而非全部保留在記憶體
+    
+    記憶體中只保留每筆記錄在文件中的位置、目錄表和統計數字；
+    同一目錄下的文件共用目錄字串，記錄中只存目錄編號和文件名。
+    迭代時以mmap讀回，組成與get_file_info_safe相同格式的字典。
+    """
+    def __init__(self, spool_path):
+        self.spool_path = spool_path
+        self.dir_table = []
+        self.dir_index = {}
+        self.offsets = array('q')
+        self.type_offsets = {}  # 按類型分區的記錄位置，選單篩選時無需重新掃描
+        self.type_dirs = {}  # 各類型文件所在的目錄編號
+        self.total_size = 0
+        self._spool = open(spool_path, 'wb')
+        self._spool_size = 0
+    
+    def _write_line(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        self._spool.write(line)
+        offset = self._spool_size
+        self._spool_size += len(line)
+        return offset
+    
+    def append(self, photo_info):
+        """寫入一個文件的信息"""
+        directory, _, name = photo_info['path'].rpartition('/')
+        dir_id = self.dir_index.get(directory)
+        if dir_id is None:
+            dir_id = self.dir_index[directory] = len(self.dir_table)
+            self.dir_table.append(directory)
+            # 目錄表也寫入暫存文件，程式中斷後仍可還原完整路徑
+            self._write_line({'dir_id': dir_id, 'dir_path': directory})
+        
+        file_type = photo_info['type']
+        offset = self._write_line({
+            'dir': dir_id,
+            'name': name,
+            'size': photo_info['size'],
+            'modified': photo_info['modified'],
+            'created': photo_info['created'],
+            'type': file_type
+        })
+        self.offsets.append(offset)
+        
+        type_offsets = self.type_offsets.get(file_type)
+        if type_offsets is None:
+            type_offsets = self.type_offsets[file_type] = array('q')
+        type_offsets.append(offset)
+        self.type_dirs.setdefault(file_type, set()).add(dir_id)
+        self.total_size += photo_info['size']
+    
+    def close(self):
+        """結束寫入，之後才能迭代讀取"""
+        if not self._spool.closed:
+            self._spool.close()
+    
+    def path_of(self, record):
+        """重組記錄的完整路徑"""
+        return f"{self.dir_table[record['dir']]}/{record['name']}"
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def __iter__(self):
+        return self._read(self.offsets)
+    
+    def _read(self, offsets):
+        """依序讀回指定位置的記錄"""
+        if not offsets:
+            return
+        
+        with open(self.spool_path, 'rb') as spool:
+            with mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for offset in offsets:
+                    record = json.loads(data[offset:data.find(b'\n', offset)])
+                    yield {
+                        'path': self.path_of(record),
+                        'name': record['name'],
+                        'size': record['size'],
+                        'modified': record['modified'],
+                        'created': record['created'],
+                        'type': record['type']
+                    }
+    
+    def count_type(self, file_type):
+        """指定類型的文件數量"""
+        return len(self.type_offsets.get(file_type, ()))
+    
+    def directories(self):
+        """所有文件所在的目錄路徑"""
+        return list(self.dir_table)
+    
+    def select(self, file_type):
+        """返回指定類型文件的視圖"""
+        return PhotoSelection(self, self.type_offsets.get(file_type, array('q')),
+                              self.type_dirs.get(file_type, ()))
+
+class PhotoSelection:
+    """PhotoCatalog中部分記錄的唯讀視圖"""
+    def __init__(self, catalog, offsets, dir_ids=()):
+        self.catalog = catalog
+        self.offsets = offsets
+        self.dir_ids = dir_ids
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def __iter__(self):
+        return self.catalog._read(self.offsets)
+    
+    def directories(self):
+        """視圖中文件所在的目錄路徑"""
+        return [self.catalog.dir_table[dir_id] for dir_id in self.dir_ids]
+
+class DownloadManifest:
+    """已下載文件的記錄，鍵為 (設備UDID, 遠端路徑)，值為 (大小, 修改時間)
+    
+    啟動時整份載入記憶體，下載成功時只更新記憶體並暫存待寫入的項目，
+    commit()時才一次寫回磁碟，避免每個文件一次小寫入。
+    記錄文件無法開啟（如HOME不存在或唯讀）時只保存在記憶體中，不影響下載。
+    """
+    def __init__(self, path):
+        self.entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self.path = None
+        
+        try:
+            self._load(path)
+        except Exception as e:
+            logger.warning(f"無法開啟下載記錄 {path}，本次只記錄在記憶體中: {e}")
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self.path = None
+            self.entries = {}
+    
+    def _load(self, path):
+        """開啟記錄文件並讀入既有記錄"""
+        if sqlite3 is not None:
+            self.path = Path(path)
+            self._conn = sqlite3.connect(str(self.path))
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS downloaded ("
+                "udid TEXT NOT NULL, path TEXT NOT NULL, size INTEGER, mtime INTEGER, "
+                "PRIMARY KEY (udid, path))"
+            )
+            for udid, remote_path, size, mtime in self._conn.execute(
+                    "SELECT udid, path, size, mtime FROM downloaded"):
+                self.entries[(udid, remote_path)] = (size, mtime)
+        else:
+            self.path = Path(path).with_suffix('.json')
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for udid, files in json.load(f).items():
+                        for remote_path, (size, mtime) in files.items():
+                            self.entries[(udid, remote_path)] = (size, mtime)
+            except FileNotFoundError:
+                pass
+    
+    @staticmethod
+    def _key(photo_info):
+        return (photo_info['size'], int(photo_info['modified']))
+    
+    def is_current(self, udid, photo_info):
+        """文件是否已以相同大小和修改時間下載過"""
+        return self.entries.get((udid, photo_info['path'])) == self._key(photo_info)
+    
+    def record(self, udid, photo_info):
+        """記錄下載成功的文件，可由多個下載線程同時調用"""
+        key = (udid, photo_info['path'])
+        value = self._key(photo_info)
+        with self._lock:
+            self.entries[key] = value
+            self._pending[key] = value
+    
+    def commit(self):
+        """將新的記錄寫回磁碟"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.path is None:
+            return
+        
+        if self._conn is not None:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO downloaded (udid, path, size, mtime) VALUES (?, ?, ?, ?)",
+                    [(udid, remote_path, size, mtime) for (udid, remote_path), (size, mtime) in pending.items()]
+                )
+        else:
+            with self._lock:
+                data = {}
+                for (udid, remote_path), value in self.entries.items():
+                    data.setdefault(udid, {})[remote_path] = list(value)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+    
+    def close(self):
+        """寫回記錄並關閉資料庫"""
+        self.commit()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class _GatherTaskGroup:
+    """Python 3.11以前沒有asyncio.TaskGroup時的替代品
+    
+    離開時以gather等待尚未完成的任務；區塊內出現異常時先取消它們。
+    已完成的任務不保留，記憶體不隨文件數增長。
+    """
+    def __init__(self):
+        self._tasks = set()
+    
+    def create_task(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for task in self._tasks:
+                task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=exc_type is not None)
+        return False
+
+_TaskGroup = getattr(asyncio, 'TaskGroup', _GatherTaskGroup)
+
 class InterruptibleOperation:
     """可中斷操作的基礎類別"""
     def __init__(self):
         self.should_stop = threading.Event()
         self.progress_callback = None
         self.status_message = ""
+        self.progress_interval = 0.1  # 進度回調最短間隔（秒）
+        self._last_progress_ts = 0.0
         
     def stop(self):
         """設置停止標誌"""
@@ -86,30 +461,258 @@ class InterruptibleOperation:
         """設置進度回調函數"""
         self.progress_callback = callback
     
+    def progress_due(self, current, total):
+        """檢查是否到了該回調進度的時候，可在組裝訊息前先判斷"""
+        if self.progress_callback is None:
+            return False
+        return current == total or time.monotonic() - self._last_progress_ts >= self.progress_interval
+    
     def update_progress(self, current, total, message=""):
-        """更新進度"""
+        """更新進度，限制回調頻率以免頻繁輸出拖慢下載"""
+        if not self.progress_due(current, total):
+            return
+        self._last_progress_ts = time.monotonic()
         self.status_message = message
-        if self.progress_callback:
-            self.progress_callback(current, total, message)
+        self.progress_callback(current, total, message)
 
 class SafeiPhonePhotoReader(InterruptibleOperation):
-    def __init__(self):
+    def __init__(self, udid=None, manifest=None, handle_sigint=True):
+        """udid指定要連接的設備，None時連接usbmuxd找到的第一台；
+        同時操作多台設備時由呼叫者傳入共用的manifest，並自行處理Ctrl+C
+        """
         super().__init__()
+        
+        self.udid = udid
         self.lockdown = None
-        self.afc = None
+        self._afc_main = None
+        self._afc_owner = None
+        self._afc_local = threading.local()
+        self._afc_workers = []
+        self._afc_generation = 0
+        self._afc_lock = threading.Lock()
+        
+        # AFC API探測結果，於_detect_afc_api_version中設定
+        self._afc_open = None
+        self._afc_bulk = None
+        self._afc_pull = None
+        self._afc_fopen = None
+        self._afc_fread = None
+        self._afc_fclose = None
+        self._afc_listdir = None
+        self._afc_ls = None
+        self._afc_list_directory = None
+        self._progress_lock = threading.Lock()
+        self._stop_announced = False
+        self._stop_waker = None  # 批量下載期間喚醒事件循環的函數，可從其他線程調用
+        
+        # AFC服務在每個連接上單線程處理請求，多出的併發只會在usbmuxd中排隊，
+        # 與APFS全局readdir鎖類似：超過少量併發後吞吐反而下降。
+        # 因此只在AFC請求期間持有許可，本地磁碟寫入不佔用
+        self.afc_concurrency = self._env_afc_concurrency()
+        self._afc_sem = threading.BoundedSemaphore(self.afc_concurrency)
         self.device_info = {}
         self.max_workers = 4  # 降低並發數以提高穩定性
+        self.download_concurrency = 16  # 互動模式下同時進行的下載數
+        # 互動模式下載專用的線程池，不與預設執行器上的其他工作互相阻塞；
+        # 線程長期存在，各自的AFC連接在多次下載之間重用，由reset_connection關閉。
+        # 大小須與download_concurrency一致，由_download_pool在下載時建立
+        self._afc_pool = None
+        self._afc_pool_size = 0
+        pool_size = min(32, max(8, os.cpu_count() or 1))
+        # 大文件寫盤用的線程池，讓下一塊的USB讀取與本塊的磁碟寫入重疊
+        self._write_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="disk")
+        self.scan_queue_size = 1024  # 待掃描目錄隊列上限，控制記憶體用量
+        self.pull_threshold = 1 << 20  # 不小於此大小的文件優先使用AFC pull
+        self.large_file_threshold = 32 * 1024 * 1024  # 邊掃描邊下載時，大文件走獨立隊列
+        self.stream_chunk_size = AFC_CHUNK  # 流式下載每次讀取2MB
+        self.socket_buffer_size = 1 << 20  # AFC連接socket的收發緩衝區大小
+        # 掃描結果暫存文件，多台設備同時掃描時各用一份
+        self.scan_spool_path = f'iphone_reader.{udid}.scan.ndjson' if udid else 'iphone_reader.scan.ndjson'
+        self.path_cache_dir = Path.home() / '.cache' / 'iphone_reader'  # 各設備已知照片目錄
+        self._thread_buffers = threading.local()
+        self._failures = []  # 本次下載失敗的文件路徑，結束時一次列出
+        self.skipped_count = 0  # 本次因已下載過而跳過的文件數
+        self._created_dirs = set()  # 本次操作中已建立的本地目錄
+        self.force_download = False  # 為True時忽略下載記錄，全部重新下載
+        self._owns_manifest = manifest is None  # 外部傳入的記錄由呼叫者負責關閉
+        self.manifest = manifest if manifest is not None else DownloadManifest(_MANIFEST_PATH)
         self.found_photos = []
         self.scan_progress = {"current": 0, "total": 0, "message": ""}
         
+        # 單次分析期間的listdir/stat快取（LRU），分析結束後清除
+        self.cache_size = 4096
+        self._listdir_cache = None
+        self._stat_cache = None
+        self._cache_lock = threading.Lock()
+        
+        # 跨多次分析保留的目錄內容：{目錄路徑: (目錄mtime, [媒體文件名], [子目錄])}
+        # 目錄增刪文件時mtime會改變；mtime相同的目錄重新分析時不再listdir，只stat媒體文件
+        self._catalog = {}
+        self._catalog_udid = None
+        
         # 設置Ctrl+C處理
-        signal.signal(signal.SIGINT, self._signal_handler)
+        if handle_sigint:
+            signal.signal(signal.SIGINT, self._signal_handler)
         
+    @staticmethod
+    def _env_afc_concurrency(default=3):
+        """讀取IPHONE_AFC_CONCURRENCY，格式錯誤時使用預設值而不中止程式"""
+        value = os.environ.get("IPHONE_AFC_CONCURRENCY")
+        if value is None:
+            return default
+        try:
+            return max(1, int(value))
+        except ValueError:
+            logger.warning(f"IPHONE_AFC_CONCURRENCY={value!r} 不是整數，使用預設值 {default}")
+            return default
+    
     def _signal_handler(self, signum, frame):
-        """處理Ctrl+C信號"""
-        print("\n\n⚠️  檢測到中斷信號 (Ctrl+C)")
-        print("正在安全停止操作...")
-        self.stop()
+        """處理Ctrl+C信號
+        
+        信號處理函數只設置停止標誌：print和logging都會取得鎖，
+        若主線程正持有同一把鎖時收到信號會造成死鎖，提示改由_announce_stop輸出。
+        下載進行中時另外喚醒事件循環，讓等待中的任務立即放棄。
+        """
+        self.should_stop.set()
+        self._wake_stop_waiters()
+    
+    def stop(self):
+        """設置停止標誌並喚醒等待中的下載任務"""
+        super().stop()
+        self._wake_stop_waiters()
+    
+    def _wake_stop_waiters(self):
+        """通知正在運行的事件循環已收到停止請求"""
+        waker = self._stop_waker
+        if waker is not None:
+            try:
+                waker()
+            except RuntimeError:
+                pass  # 事件循環已結束
+    
+    def _announce_stop(self):
+        """在正常流程中顯示一次中斷提示"""
+        with self._progress_lock:
+            if not self.is_stopped() or self._stop_announced:
+                return
+            self._stop_announced = True
+        
+        _emit(_MSG_STOP_SIGNAL)
+        logger.info("⏹ 收到停止信號")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._afc_pool is not None:
+            self._afc_pool.shutdown(wait=True, cancel_futures=True)
+        self._write_pool.shutdown(wait=True)
+        self.reset_connection()
+        if self._owns_manifest:
+            try:
+                self.manifest.close()
+            except Exception as e:
+                logger.error(f"保存下載記錄失敗: {e}")
+        return False
+    
+    def reset(self):
+        """重置暫時狀態，設備連接保持不動"""
+        self.reset_counters()
+    
+    def reset_counters(self):
+        """重置停止狀態和進度等單次操作的狀態"""
+        super().reset()
+        self._stop_announced = False
+        self._last_progress_ts = 0.0
+        self.scan_progress = {"current": 0, "total": 0, "message": ""}
+        self._failures = []
+        self.skipped_count = 0
+        self._created_dirs = set()
+    
+    def reset_connection(self):
+        """關閉所有AFC連接和lockdown會話，下次分析時重新連接"""
+        with self._afc_lock:
+            services = [entry[2] for entry in self._afc_workers]
+            self._afc_workers = []
+            if self._afc_main is not None:
+                services.append(self._afc_main)
+            self._afc_main = None
+            self._afc_owner = None
+            self._afc_generation += 1
+            lockdown, self.lockdown = self.lockdown, None
+        
+        if lockdown is not None:
+            services.append(lockdown)
+        self._close_services(services)
+    
+    @staticmethod
+    def _close_services(services):
+        """關閉AFC連接或lockdown會話，忽略關閉時的錯誤"""
+        for service in services:
+            try:
+                if hasattr(service, 'close'):
+                    service.close()
+            except Exception as e:
+                if _DEBUG:
+                    logger.debug("關閉連接失敗: %s", e)
+    
+    @property
+    def afc(self):
+        """當前線程使用的AFC連接
+        
+        AFC連接不是線程安全的，工作線程會各自建立獨立連接，
+        建立AFC服務的線程則使用主連接。
+        """
+        if self._afc_main is None or threading.get_ident() == self._afc_owner:
+            return self._afc_main
+        
+        local = self._afc_local
+        if getattr(local, 'generation', None) != self._afc_generation:
+            with self._afc_lock:
+                local.afc = self._new_afc_service()
+                local.generation = self._afc_generation
+                self._afc_workers.append((threading.current_thread(), local.generation, local.afc))
+        return local.afc
+    
+    @afc.setter
+    def afc(self, service):
+        with self._afc_lock:
+            self._afc_main = service
+            self._afc_owner = threading.get_ident()
+            # 主連接更換後，工作線程需重新建立連接
+            self._afc_generation += 1
+    
+    def _download_pool(self):
+        """取得下載線程池，線程數不少於download_concurrency
+        
+        download_concurrency在建立讀取器後才由--concurrency設定，因此第一次下載時才建立；
+        之後調高時換成較大的線程池，舊線程閒置後結束，其AFC連接由_close_worker_afc關閉。
+        """
+        size = max(1, self.download_concurrency)
+        if self._afc_pool is None or self._afc_pool_size < size:
+            if self._afc_pool is not None:
+                self._afc_pool.shutdown(wait=False)
+            self._afc_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="afc")
+            self._afc_pool_size = size
+        return self._afc_pool
+    
+    def _close_worker_afc(self):
+        """關閉已結束的工作線程所建立的AFC連接
+        
+        掃描和下載的線程池可能同時運行，仍在工作的線程的連接保持不動。
+        """
+        with self._afc_lock:
+            workers = []
+            remaining = []
+            for entry in self._afc_workers:
+                thread, generation, _ = entry
+                if thread.is_alive() and generation == self._afc_generation:
+                    remaining.append(entry)
+                else:
+                    workers.append(entry[2])
+            self._afc_workers = remaining
+        
+        self._close_services(workers)
         
     def connect_device(self):
         """增強的設備連接功能"""
@@ -120,7 +723,10 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             self.update_progress(0, 100, "正在搜索iPhone設備...")
             logger.info("正在搜索iPhone設備...")
             
-            self.lockdown = create_using_usbmux()
+            if self.udid:
+                self.lockdown = create_using_usbmux(serial=self.udid)
+            else:
+                self.lockdown = create_using_usbmux()
             
             if self.is_stopped():
                 return False
@@ -136,6 +742,11 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
                 'udid': self.lockdown.udid
             }
             
+            # 換了設備時目錄快取不再適用
+            if self._catalog_udid != self.device_info['udid']:
+                self._catalog = {}
+                self._catalog_udid = self.device_info['udid']
+            
             self.update_progress(50, 100, f"已連接: {self.device_info['name']}")
             logger.info(f"✓ 已連接設備: {self.device_info['name']}")
             logger.info(f"✓ 型號: {self.device_info['model']}")
@@ -163,6 +774,41 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             logger.error("4. 嘗試重新插拔USB線")
             return False
     
+    def _new_afc_service(self, announce=False):
+        """建立AFC連接並放大其socket緩衝區"""
+        service = AfcService(self.lockdown)
+        self._tune_socket_buffers(service, announce)
+        return service
+    
+    def _tune_socket_buffers(self, service, announce=False):
+        """放大AFC連接底層usbmux socket的SO_SNDBUF/SO_RCVBUF
+        
+        預設緩衝區會限制usbmuxd的傳輸速率；核心可能調整或限制設定值，
+        因此讀回實際值記錄在日誌中。不同版本的pymobiledevice3屬性名稱不同，失敗時略過。
+        """
+        connection = getattr(service, 'service', None)
+        sock = getattr(connection, 'socket', None) or getattr(connection, 'sock', None)
+        if sock is None:
+            if _DEBUG:
+                logger.debug("找不到AFC連接的socket，略過緩衝區調整")
+            return
+        
+        try:
+            before = (sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+                      sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_buffer_size)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_buffer_size)
+            after = (sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+                     sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+        except (OSError, AttributeError) as e:
+            logger.warning(f"⚠ 無法調整socket緩衝區: {e}")
+            return
+        
+        if announce:
+            logger.info(f"✓ socket緩衝區 SNDBUF {before[0]} → {after[0]}, RCVBUF {before[1]} → {after[1]}")
+        elif _DEBUG:
+            logger.debug("socket緩衝區 SNDBUF %d → %d, RCVBUF %d → %d", before[0], after[0], before[1], after[1])
+    
     def setup_afc_service(self):
         """設定AFC服務"""
         if self.is_stopped():
@@ -171,7 +817,7 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
         try:
             self.update_progress(0, 100, "正在初始化AFC服務...")
             
-            self.afc = AfcService(self.lockdown)
+            self.afc = self._new_afc_service(announce=True)
             
             # 檢測AFC API版本並記錄可用方法
             self._detect_afc_api_version()
@@ -198,26 +844,37 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             return False
     
     def _detect_afc_api_version(self):
-        """檢測AFC API版本和可用方法"""
-        available_methods = []
-        
-        # 檢測文件讀取方法
-        if hasattr(self.afc, 'open'):
-            available_methods.append('open')
-        if hasattr(self.afc, 'file_open'):
-            available_methods.append('file_open')
-        if hasattr(self.afc, 'get_file_contents'):
-            available_methods.append('get_file_contents')
-        if hasattr(self.afc, 'pull_file'):
-            available_methods.append('pull_file')
-        if hasattr(self.afc, 'pull'):
-            available_methods.append('pull')
-        
-        # 檢測目錄操作方法
-        if hasattr(self.afc, 'listdir'):
-            available_methods.append('listdir')
-        if hasattr(self.afc, 'ls'):
-            available_methods.append('ls')
+        """檢測AFC API版本和可用方法，並快取選用的方法
+        
+        快取的是類別上的函數而非綁定方法，調用時傳入當前線程的連接，
+        工作線程的獨立連接也能共用同一份探測結果。
+        """
+        afc_type = type(self.afc)
+        
+        def find_method(*names):
+            for name in names:
+                method = getattr(afc_type, name, None)
+                if method is not None:
+                    return method
+            return None
+        
+        # 文件讀取方法
+        self._afc_open = find_method('open', 'file_open')
+        self._afc_bulk = find_method('get_file_contents')
+        self._afc_pull = find_method('pull_file', 'pull')
+        self._afc_fopen = find_method('fopen')
+        self._afc_fread = find_method('fread')
+        self._afc_fclose = find_method('fclose')
+        
+        # 目錄操作方法
+        self._afc_listdir = find_method('listdir')
+        self._afc_ls = find_method('ls')
+        self._afc_list_directory = find_method('list_directory')
+        
+        available_methods = [
+            name for name in ('open', 'file_open', 'fopen', 'get_file_contents', 'pull_file', 'pull', 'listdir', 'ls')
+            if hasattr(afc_type, name)
+        ]
         
         logger.info(f"✓ 檢測到AFC API方法: {', '.join(available_methods)}")
         
@@ -226,52 +883,97 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
         
         return available_methods
     
+    def _cache_lookup(self, cache, key):
+        """查詢LRU快取，返回 (是否命中, 值)"""
+        if cache is None:
+            return False, None
+        
+        with self._cache_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return True, cache[key]
+        return False, None
+    
+    def _cache_store(self, cache, key, value):
+        """寫入LRU快取，超出上限時淘汰最久未使用的項目"""
+        if cache is None:
+            return
+        
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+    
     def safe_listdir(self, directory_path):
+        """安全的目錄列表功能，分析期間重用已列出的結果"""
+        if self.is_stopped():
+            return None
+        
+        hit, items = self._cache_lookup(self._listdir_cache, directory_path)
+        if hit:
+            return items
+        
+        items = self._listdir_uncached(directory_path)
+        if not self.is_stopped():
+            self._cache_store(self._listdir_cache, directory_path, items)
+        return items
+    
+    def safe_stat(self, file_path):
+        """獲取文件stat信息，分析期間重用已取得的結果"""
+        hit, stat_info = self._cache_lookup(self._stat_cache, file_path)
+        if hit:
+            return stat_info
+        
+        with self._afc_sem:
+            stat_info = self.afc.stat(file_path)
+        self._cache_store(self._stat_cache, file_path, stat_info)
+        return stat_info
+    
+    def _listdir_uncached(self, directory_path):
         """安全的目錄列表功能，處理各種錯誤和API版本"""
         if self.is_stopped():
             return None
             
         try:
-            # 先檢查目錄是否存在
-            if not self.afc.exists(directory_path):
-                logger.debug(f"目錄不存在: {directory_path}")
-                return None
-            
-            # 檢查是否為目錄
-            if not self.afc.isdir(directory_path):
-                logger.debug(f"不是目錄: {directory_path}")
-                return None
-            
-            # 嘗試不同的列表方法
+            # 直接嘗試列出目錄，不存在或不是目錄時列表方法會失敗並返回None，
+            # 省去事先exists/isdir的兩次AFC往返
             items = None
             
             # 方法1: 標準listdir
-            if hasattr(self.afc, 'listdir'):
+            if self._afc_listdir is not None:
                 try:
-                    items = self.afc.listdir(directory_path)
+                    with self._afc_sem:
+                        items = self._afc_listdir(self.afc, directory_path)
                 except Exception as e:
-                    logger.debug(f"listdir方法失敗: {e}")
+                    if _DEBUG:
+                        logger.debug("listdir方法失敗: %s", e)
             
             # 方法2: 嘗試ls方法
-            if items is None and hasattr(self.afc, 'ls'):
+            if items is None and self._afc_ls is not None:
                 try:
-                    result = self.afc.ls(directory_path)
+                    with self._afc_sem:
+                        result = self._afc_ls(self.afc, directory_path)
                     # ls方法可能返回不同格式，需要處理
                     if isinstance(result, list):
                         items = result
                     elif isinstance(result, dict) and 'entries' in result:
                         items = result['entries']
                     else:
-                        logger.debug(f"ls方法返回未知格式: {type(result)}")
+                        if _DEBUG:
+                            logger.debug("ls方法返回未知格式: %s", type(result))
                 except Exception as e:
-                    logger.debug(f"ls方法失敗: {e}")
+                    if _DEBUG:
+                        logger.debug("ls方法失敗: %s", e)
             
             # 方法3: 嘗試list_directory
-            if items is None and hasattr(self.afc, 'list_directory'):
+            if items is None and self._afc_list_directory is not None:
                 try:
-                    items = self.afc.list_directory(directory_path)
+                    with self._afc_sem:
+                        items = self._afc_list_directory(self.afc, directory_path)
                 except Exception as e:
-                    logger.debug(f"list_directory方法失敗: {e}")
+                    if _DEBUG:
+                        logger.debug("list_directory方法失敗: %s", e)
             
             if items is not None:
                 # 過濾掉特殊項目
@@ -290,17 +992,21 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
                 
                 return filtered_items
             
-            logger.debug(f"所有列表方法都失敗: {directory_path}")
+            if _DEBUG:
+                logger.debug("所有列表方法都失敗: %s", directory_path)
             return None
             
         except AfcError as afc_error:
-            logger.debug(f"AFC錯誤，無法訪問目錄 {directory_path}: {afc_error}")
+            if _DEBUG:
+                logger.debug("AFC錯誤，無法訪問目錄 %s: %s", directory_path, afc_error)
             return None
         except PermissionError:
-            logger.debug(f"權限錯誤，無法訪問目錄 {directory_path}")
+            if _DEBUG:
+                logger.debug("權限錯誤，無法訪問目錄 %s", directory_path)
             return None
         except Exception as e:
-            logger.debug(f"其他錯誤，無法訪問目錄 {directory_path}: {e}")
+            if _DEBUG:
+                logger.debug("其他錯誤，無法訪問目錄 %s: %s", directory_path, e)
             return None
     
     def get_photo_directories_safe(self):
@@ -334,6 +1040,17 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             '/Applications'
         ]
         
+        # 優先驗證上次找到的目錄，全部失效時才完整搜索
+        cached_paths = self._load_cached_photo_directories()
+        if cached_paths:
+            self.update_progress(0, len(cached_paths), "正在檢查已知照片目錄...")
+            available_paths = [path for path in cached_paths if self.safe_listdir(path)]
+            if available_paths:
+                logger.info(f"✓ 使用已知照片目錄: {', '.join(available_paths)}")
+                self.update_progress(len(cached_paths), len(cached_paths), f"找到 {len(available_paths)} 個可用目錄")
+                return available_paths
+            logger.info("已知照片目錄均無法訪問，重新搜索")
+        
         available_paths = []
         total_paths = len(potential_paths)
         
@@ -349,120 +1066,272 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             items = self.safe_listdir(path)
             if items is not None and len(items) > 0:
                 # 檢查是否包含照片相關內容
-                photo_related = False
-                for item in items[:10]:  # 只檢查前10個項目
-                    item_lower = item.lower()
-                    if (item_lower.endswith(('.jpg', '.jpeg', '.png', '.heic', '.mov', '.mp4')) or
-                        item_lower.startswith(('img_', 'dsc_', '100apple', '101apple', '102apple')) or
-                        'apple' in item_lower):
-                        photo_related = True
-                        break
+                # 只檢查前10個項目
+                photo_related = any(_PHOTO_HINT.search(item) for item in items[:10])
                 
                 if photo_related or len(items) > 50:  # 包含照片或項目很多
                     available_paths.append(path)
                     logger.info(f"✓ 找到照片目錄: {path} ({len(items)} 項目)")
         
         self.update_progress(total_paths, total_paths, f"找到 {len(available_paths)} 個可用目錄")
+        
+        if available_paths and not self.is_stopped():
+            self._save_cached_photo_directories(available_paths)
         return available_paths
     
-    def scan_photos_safe(self, directory_path, max_depth=3):
-        """安全的照片掃描，限制遞歸深度"""
+    def _photo_directory_cache_file(self):
+        """當前設備的照片目錄快取文件路徑"""
+        udid = self.device_info.get('udid')
+        if not udid:
+            return None
+        return self.path_cache_dir / f"{udid}.json"
+    
+    def _load_cached_photo_directories(self):
+        """讀取上次找到的照片目錄，iOS版本變更後視為失效"""
+        cache_file = self._photo_directory_cache_file()
+        if cache_file is None or not cache_file.exists():
+            return []
+        
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            if _DEBUG:
+                logger.debug("讀取照片目錄快取失敗 %s: %s", cache_file, e)
+            return []
+        
+        if cached.get('ios_version') != self.device_info.get('ios_version'):
+            return []
+        return list(cached.get('paths', []))
+    
+    def _save_cached_photo_directories(self, paths):
+        """保存找到的照片目錄，供下次分析優先使用"""
+        cache_file = self._photo_directory_cache_file()
+        if cache_file is None:
+            return
+        
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'udid': self.device_info.get('udid'),
+                    'ios_version': self.device_info.get('ios_version'),
+                    'paths': paths,
+                    'ts': time.time()
+                }, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"⚠ 無法保存照片目錄快取: {e}")
+    
+    def scan_photos_safe(self, directory_path, max_depth=3, on_found=None):
+        """安全的照片掃描，使用線程池並行遍歷目錄，限制遞歸深度，返回媒體文件信息
+        
+        提供on_found時，每個目錄掃描完成後立即以其中的文件信息逐一調用（可能來自多個線程），
+        結果不再另外收集，返回空列表，記憶體用量不隨文件數增長。
+        """
         if max_depth <= 0 or self.is_stopped():
             return []
         
         photos = []
-        items = self.safe_listdir(directory_path)
+        photos_lock = threading.Lock()
+        if on_found is None:
+            def on_found(file_info):
+                with photos_lock:
+                    photos.append(file_info)
+        dir_queue = queue.Queue(maxsize=self.scan_queue_size)
+        state = {'tasks': 1}
+        tasks_done = threading.Condition()
         
-        if items is None:
-            return photos
+        # 起始目錄的mtime需另外取得，子目錄的mtime來自上層目錄掃描時的stat
+        root_mtime = None
+        try:
+            root_mtime = _to_timestamp(self.safe_stat(directory_path).get('st_mtime'))
+        except Exception as e:
+            if _DEBUG:
+                logger.debug("獲取目錄時間失敗 %s: %s", directory_path, e)
+        
+        dir_queue.put((directory_path, max_depth, root_mtime))
+        
+        def add_task(item, pending):
+            with tasks_done:
+                state['tasks'] += 1
+            try:
+                dir_queue.put_nowait(item)
+            except queue.Full:
+                # 隊列已滿時由當前線程自行處理，避免所有線程互相等待
+                pending.append(item)
+        
+        def finish_task():
+            with tasks_done:
+                state['tasks'] -= 1
+                if state['tasks'] == 0:
+                    tasks_done.notify_all()
+        
+        def worker():
+            pending = []
+            while True:
+                item = pending.pop() if pending else dir_queue.get()
+                if item is None:
+                    return
+                
+                path, depth, mtime = item
+                try:
+                    # 中斷後仍需消化隊列中的任務，讓計數器歸零
+                    if self.is_stopped():
+                        continue
+                    
+                    files, subdirs = self._scan_directory(path, mtime)
+                    for file_info in files:
+                        on_found(file_info)
+                    
+                    # 處理子目錄（限制數量和深度）
+                    if depth > 1:
+                        for subdir, subdir_mtime in subdirs[:20]:
+                            add_task((subdir, depth - 1, subdir_mtime), pending)
+                except Exception as e:
+                    if _DEBUG:
+                        logger.debug("掃描目錄失敗 %s: %s", path, e)
+                finally:
+                    finish_task()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _ in range(self.max_workers):
+                executor.submit(worker)
+            
+            with tasks_done:
+                while state['tasks'] > 0:
+                    tasks_done.wait(0.5)
+            
+            for _ in range(self.max_workers):
+                dir_queue.put(None)
+        
+        self._close_worker_afc()
+        return photos
+    
+    def _scan_directory(self, directory_path, mtime=None):
+        """列出單一目錄，返回媒體文件信息和 (子目錄路徑, mtime) 列表
+        
+        mtime與上次掃描時相同的目錄沒有增刪項目，直接用self._catalog中的文件名和子目錄，
+        省去listdir和非媒體項目的stat。文件原地修改不會改變目錄mtime，
+        因此媒體文件和子目錄仍逐個重新stat，取得最新的大小和時間。
+        """
+        base = directory_path.rstrip('/') + '/'
+        
+        cached = self._catalog.get(directory_path) if mtime is not None else None
+        if cached is not None and cached[0] == mtime:
+            files = []
+            for name in cached[1]:
+                if self.is_stopped():
+                    break
+                try:
+                    file_info = self.get_file_info_safe(base + name, self.safe_stat(base + name))
+                except Exception as e:
+                    if _DEBUG:
+                        logger.debug("處理項目失敗 %s: %s", base + name, e)
+                    continue
+                if file_info is not None:
+                    files.append(file_info)
+            self._count_found(len(files))
+            
+            # 子目錄內的變動不會反映在本目錄的mtime上，需重新取得
+            subdirs = []
+            for subdir in cached[2]:
+                if self.is_stopped():
+                    break
+                try:
+                    subdir_mtime = _to_timestamp(self.safe_stat(subdir).get('st_mtime'))
+                except Exception as e:
+                    if _DEBUG:
+                        logger.debug("獲取目錄時間失敗 %s: %s", subdir, e)
+                    continue
+                subdirs.append((subdir, subdir_mtime))
+            return files, subdirs
         
-        # 分離文件和子目錄
         files = []
         subdirs = []
         
+        items = self.safe_listdir(directory_path)
+        if items is None:
+            return files, subdirs
+        
         for item in items:
             if self.is_stopped():
                 break
                 
-            item_path = f"{directory_path.rstrip('/')}/{item}"
+            item_path = base + item
             
             try:
-                if self.afc.isdir(item_path):
-                    subdirs.append(item_path)
+                # 只發出一次stat，由st_ifmt判斷目錄，同時取得大小和時間
+                stat_info = self.safe_stat(item_path)
+                
+                if stat_info.get('st_ifmt') == 'S_IFDIR':
+                    subdirs.append((item_path, _to_timestamp(stat_info.get('st_mtime'))))
                 else:
                     if self.is_media_file(item):
-                        files.append(item_path)
-                        self.scan_progress["current"] += 1
-                        
-                        # 每找到20個文件更新一次進度
-                        if self.scan_progress["current"] % 20 == 0:
-                            self.update_progress(
-                                self.scan_progress["current"], 
-                                self.scan_progress["total"], 
-                                f"已找到 {self.scan_progress['current']} 個媒體文件"
-                            )
+                        file_info = self.get_file_info_safe(item_path, stat_info)
+                        if file_info is None:
+                            continue
+                        files.append(file_info)
+                        self._count_found(1)
             except Exception as e:
-                logger.debug(f"處理項目失敗 {item_path}: {e}")
+                if _DEBUG:
+                    logger.debug("處理項目失敗 %s: %s", item_path, e)
                 continue
         
-        # 添加當前目錄的文件
-        photos.extend(files)
+        # 只快取完整掃描過的目錄
+        if mtime is not None and not self.is_stopped():
+            self._catalog[directory_path] = (mtime, [f['name'] for f in files], [subdir for subdir, _ in subdirs])
         
-        # 處理子目錄（限制數量和深度）
-        if subdirs and not self.is_stopped():
-            # 限制同時處理的子目錄數量
-            max_subdirs = min(20, len(subdirs))
-            for subdir in subdirs[:max_subdirs]:
-                if self.is_stopped():
-                    break
-                    
-                try:
-                    sub_photos = self.scan_photos_safe(subdir, max_depth - 1)
-                    photos.extend(sub_photos)
-                except Exception as e:
-                    logger.debug(f"掃描子目錄失敗 {subdir}: {e}")
-                    continue
+        return files, subdirs
+    
+    def _count_found(self, count):
+        """累計找到的媒體文件數，每跨過20個更新一次進度"""
+        if not count:
+            return
         
-        return photos
+        with self._progress_lock:
+            before = self.scan_progress["current"]
+            self.scan_progress["current"] = found = before + count
+        
+        if found // 20 != before // 20:
+            self.update_progress(
+                found, 
+                self.scan_progress["total"], 
+                f"已找到 {found} 個媒體文件"
+            )
     
     def is_media_file(self, filename):
         """檢查是否為媒體文件"""
-        media_extensions = {
-            # 圖片格式
-            '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif',
-            '.heic', '.heif', '.webp', '.raw', '.dng', '.cr2', '.nef',
-            # 影片格式
-            '.mov', '.mp4', '.avi', '.mkv', '.m4v', '.3gp', '.wmv',
-            '.flv', '.webm', '.mpg', '.mpeg'
-        }
-        filename_lower = filename.lower()
-        return any(filename_lower.endswith(ext) for ext in media_extensions)
-    
-    def get_file_info_safe(self, file_path):
-        """安全獲取文件信息"""
+        return filename.lower().endswith(_MEDIA_EXT)
+    
+    def get_file_info_safe(self, file_path, stat_info=None):
+        """安全獲取文件信息，已有stat結果時不再重複請求"""
         if self.is_stopped():
             return None
             
         try:
-            stat_info = self.afc.stat(file_path)
+            if stat_info is None:
+                stat_info = self.safe_stat(file_path)
             return {
                 'path': file_path,
-                'name': os.path.basename(file_path),
+                'name': file_path.rpartition('/')[2],
                 'size': stat_info.get('st_size', 0),
-                'modified': stat_info.get('st_mtime', 0),
-                'created': stat_info.get('st_birthtime', 0),
+                'modified': _to_timestamp(stat_info.get('st_mtime', 0)),
+                'created': _to_timestamp(stat_info.get('st_birthtime', 0)),
                 'type': self.get_file_type(file_path)
             }
         except Exception as e:
-            logger.debug(f"獲取文件信息失敗 {file_path}: {e}")
+            if _DEBUG:
+                logger.debug("獲取文件信息失敗 %s: %s", file_path, e)
             return None
     
     def get_file_type(self, file_path):
         """判斷文件類型"""
-        ext = os.path.splitext(file_path)[1].lower()
-        if ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.heic', '.heif', '.webp', '.raw', '.dng']:
+        name = file_path.rpartition('/')[2]
+        dot = name.rfind('.')
+        ext = name[dot:].lower() if dot > 0 else ''
+        if ext in _IMAGE_EXTS:
             return 'image'
-        elif ext in ['.mov', '.mp4', '.avi', '.mkv', '.m4v', '.3gp', '.wmv']:
+        elif ext in _VIDEO_EXTS:
             return 'video'
         else:
             return 'unknown'
@@ -470,18 +1339,16 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
     def safe_open_file(self, file_path, mode='rb'):
         """安全的文件打開方法，兼容不同版本的AFC API"""
         try:
-            # 嘗試新版本的API
-            if hasattr(self.afc, 'open'):
-                return self.afc.open(file_path, mode)
-            # 嘗試舊版本的API
-            elif hasattr(self.afc, 'file_open'):
-                return self.afc.file_open(file_path, mode)
+            # 使用探測到的open或file_open
+            if self._afc_open is not None:
+                with self._afc_sem:
+                    return self._afc_open(self.afc, file_path, mode)
             # 嘗試其他可能的方法
-            elif hasattr(self.afc, 'get_file_contents'):
+            elif self._afc_bulk is not None:
                 # 這個方法一次性讀取整個文件
-                data = self.afc.get_file_contents(file_path)
+                with self._afc_sem:
+                    data = self._afc_bulk(self.afc, file_path)
                 # 創建一個類似文件對象的包裝器
-                from io import BytesIO
                 return BytesIO(data)
             else:
                 raise AttributeError("AFC服務不支援文件讀取操作")
@@ -499,39 +1366,45 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             return False
             
         try:
-            # 確保本地目錄存在
-            local_dir = os.path.dirname(local_path)
-            Path(local_dir).mkdir(parents=True, exist_ok=True)
+            # 確保本地目錄存在，同一目錄只建立一次
+            self._ensure_local_dir(os.path.dirname(local_path))
             
-            # 檢查文件是否已存在且大小相同
-            if os.path.exists(local_path) and file_info:
+            # 檢查文件是否已存在且大小相同；只有下載記錄中的修改時間也相同才跳過，
+            # 設備上原地改寫、大小不變的文件和--force都會重新下載
+            if (file_info and not self.force_download and os.path.exists(local_path)
+                    and self.manifest.is_current(self.device_info.get('udid'), file_info)):
                 local_size = os.path.getsize(local_path)
                 remote_size = file_info.get('size', 0)
                 if local_size == remote_size and remote_size > 0:
-                    logger.debug(f"跳過已存在的文件: {os.path.basename(local_path)}")
+                    if _DEBUG:
+                        logger.debug("跳過已存在的文件: %s", os.path.basename(local_path))
                     return True
             
-            # 嘗試不同的下載方法
-            success = False
+            # 依序嘗試不同的下載方法，前一個拋出異常才換下一個
+            remote_size = file_info.get('size', 0) if file_info else 0
+            methods = []
+            if self._afc_fopen is not None and self._afc_fread is not None:
+                # 以AFC_CHUNK大塊讀取直接寫入本地文件描述符
+                methods.append(self._download_with_chunks)
+            elif remote_size >= self.pull_threshold and self._afc_pull is not None:
+                # 沒有fopen時大文件優先使用pull，由AFC後端直接寫入本地文件
+                methods.append(self._download_with_pull)
+            for method in (self._download_with_stream, self._download_with_bulk_read, self._download_with_pull):
+                if method not in methods:
+                    methods.append(method)
             
-            # 方法1: 使用安全的文件打開方法
-            try:
-                success = self._download_with_stream(remote_path, local_path, file_info)
-            except Exception as stream_error:
-                logger.debug(f"流式下載失敗，嘗試其他方法: {stream_error}")
-                
-                # 方法2: 嘗試一次性讀取
+            errors = []
+            for method in methods:
                 try:
-                    success = self._download_with_bulk_read(remote_path, local_path, file_info)
-                except Exception as bulk_error:
-                    logger.debug(f"批量讀取失敗: {bulk_error}")
-                    
-                    # 方法3: 嘗試使用pull_file（如果可用）
-                    try:
-                        success = self._download_with_pull(remote_path, local_path, file_info)
-                    except Exception as pull_error:
-                        logger.error(f"所有下載方法都失敗: 流式={stream_error}, 批量={bulk_error}, 拉取={pull_error}")
-                        return False
+                    success = method(remote_path, local_path, file_info)
+                    break
+                except Exception as method_error:
+                    if _DEBUG:
+                        logger.debug("%s 失敗，嘗試其他方法: %s", method.__name__, method_error)
+                    errors.append(f"{method.__name__}={method_error}")
+            else:
+                logger.error(f"所有下載方法都失敗: {', '.join(errors)}")
+                return False
             
             if success and not self.is_stopped():
                 # 驗證下載的文件
@@ -549,7 +1422,10 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
                         except:
                             pass
                     
-                    logger.info(f"✓ 已下載: {os.path.basename(local_path)} ({actual_size} bytes)")
+                    if _DEBUG:
+                        logger.debug("✓ 已下載: %s (%d bytes)", os.path.basename(local_path), actual_size)
+                    if file_info:
+                        self.manifest.record(self.device_info.get('udid'), file_info)
                     return True
                 else:
                     logger.error(f"下載後文件不存在: {local_path}")
@@ -561,28 +1437,205 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             logger.error(f"✗ 下載失敗 {os.path.basename(remote_path if 'remote_path' in locals() else 'unknown')}: {e}")
             return False
     
-    def _download_with_stream(self, remote_path, local_path, file_info):
-        """使用流式讀取下載文件"""
-        chunk_size = 512 * 1024  # 512KB chunks
-        downloaded_size = 0
+    @staticmethod
+    def _open_local(local_path):
+        """以os.open建立本地文件，並告知核心將以順序方式寫入
+        
+        下載的照片短期內不會再讀取，macOS上以F_NOCACHE讓寫入不佔用頁面快取。
+        """
+        fd = os.open(local_path, _LOCAL_OPEN_FLAGS, 0o644)
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            elif fcntl is not None and hasattr(fcntl, 'F_NOCACHE'):
+                fcntl.fcntl(fd, fcntl.F_NOCACHE, 1)
+        except OSError:
+            pass
+        return fd
+    
+    @staticmethod
+    def _close_local(fd):
+        """關閉本地文件；大文件先寫回磁碟，再請核心丟棄它佔用的頁面快取
+        
+        POSIX_FADV_DONTNEED只能丟棄已寫回的頁面，因此先fdatasync。
+        小文件逐個同步的代價太高，交給核心自行寫回。
+        """
+        try:
+            if hasattr(os, 'posix_fadvise') and hasattr(os, 'fdatasync'):
+                if os.fstat(fd).st_size >= _NOCACHE_THRESHOLD:
+                    os.fdatasync(fd)
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    
+    @staticmethod
+    def _write_all(fd, data):
+        """將資料完整寫入文件描述符，處理os.write只寫入部分的情況"""
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    
+    def _download_with_chunks(self, remote_path, local_path, file_info):
+        """以fopen/fread大塊讀取下載文件，每塊直接os.write寫入本地文件
+        
+        超過一塊的文件以雙緩衝方式進行：上一塊交給寫入線程寫盤的同時讀取下一塊，
+        最多一塊在寫、一塊在讀，記憶體用量固定為兩塊。
+        fread返回的資料少於請求的大小即表示已到EOF；以此判斷結束而非掃描時的大小，
+        掃描後在設備上變大的文件不會被截斷。
+        """
+        afc = self.afc
         total_size = file_info.get('size', 0) if file_info else 0
+        # 已知大小的小文件一次讀完：多請求一個位元組，返回不足即可確認EOF，省去額外的讀取往返
+        read_size = total_size + 1 if 0 < total_size < AFC_SMALL_FILE else AFC_CHUNK
+        pipelined = total_size > AFC_CHUNK
+        pending_write = None
+        downloaded_size = 0
         
-        with self.safe_open_file(remote_path, 'rb') as remote_file:
-            with open(local_path, 'wb') as local_file:
+        with self._afc_sem:
+            handle = self._afc_fopen(afc, remote_path, 'r')
+        try:
+            fd = self._open_local(local_path)
+            try:
                 while not self.is_stopped():
-                    chunk = remote_file.read(chunk_size)
-                    if not chunk:
+                    with self._afc_sem:
+                        data = self._afc_fread(afc, handle, read_size)
+                    # 上一塊寫完才交出這一塊，保持寫入順序
+                    if pending_write is not None:
+                        pending_write.result()
+                        pending_write = None
+                    if not data:
+                        break
+                    if pipelined:
+                        pending_write = self._write_pool.submit(self._write_all, fd, data)
+                    else:
+                        self._write_all(fd, data)
+                    downloaded_size += len(data)
+                    if len(data) < read_size:
                         break
-                    local_file.write(chunk)
-                    downloaded_size += len(chunk)
+                    read_size = AFC_CHUNK
                     
                     # 大文件顯示進度
-                    if total_size > 5 * 1024 * 1024:  # 大於5MB
-                        progress = (downloaded_size / total_size * 100) if total_size > 0 else 0
+                    if total_size > 5 * 1024 * 1024 and self.progress_due(downloaded_size, total_size):  # 大於5MB
+                        progress = downloaded_size / total_size * 100
                         self.update_progress(
-                            downloaded_size, total_size, 
+                            downloaded_size, total_size,
                             f"下載: {os.path.basename(local_path)[:20]}... ({progress:.1f}%)"
                         )
+            finally:
+                try:
+                    if pending_write is not None:
+                        pending_write.result()
+                finally:
+                    self._close_local(fd)
+        finally:
+            with self._afc_sem:
+                self._afc_fclose(afc, handle)
+        
+        if self.is_stopped():
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            return False
+        
+        return True
+    
+    def _ensure_local_dir(self, local_dir):
+        """建立本地目錄，本次操作中已建立過的目錄不再發出系統調用"""
+        if local_dir in self._created_dirs:
+            return
+        os.makedirs(local_dir, exist_ok=True)
+        self._created_dirs.add(local_dir)
+    
+    def _prepare_local_dirs(self, photos_info, output_directory):
+        """下載開始前一次建立所有目標目錄
+        
+        建立失敗（如輸出路徑是已存在的文件）只記錄錯誤，
+        相關文件下載時會再次嘗試，並逐個計為失敗。
+        """
+        directories = getattr(photos_info, 'directories', None)
+        if directories is not None:
+            remote_dirs = set(directories())
+        else:
+            remote_dirs = {photo_info['path'].rpartition('/')[0] for photo_info in photos_info}
+        
+        for remote_dir in sorted(remote_dirs):
+            local_dir = os.path.join(output_directory, remote_dir.lstrip('/'))
+            try:
+                self._ensure_local_dir(local_dir)
+            except OSError as e:
+                logger.error(f"無法建立目錄 {local_dir}: {e}")
+    
+    def _skip_downloaded(self, photo_info, output_directory):
+        """下載記錄中已有相同大小和修改時間、且目標目錄中仍有同樣大小的文件時跳過並計數
+        
+        下載記錄不含目標目錄：換了輸出目錄或本地副本被刪除時，
+        只憑記錄跳過會漏下載，因此另以一次本地stat確認文件還在。
+        """
+        if self.force_download:
+            return False
+        if not self.manifest.is_current(self.device_info.get('udid'), photo_info):
+            return False
+        try:
+            local_path = os.path.join(output_directory, photo_info['path'].lstrip('/'))
+            if os.stat(local_path).st_size != photo_info['size']:
+                return False
+        except OSError:
+            return False
+        
+        with self._progress_lock:
+            self.skipped_count += 1
+        return True
+    
+    def _stream_buffer(self):
+        """取得當前線程重用的讀取緩衝區"""
+        buffer = getattr(self._thread_buffers, 'stream', None)
+        if buffer is None or len(buffer) != self.stream_chunk_size:
+            buffer = bytearray(self.stream_chunk_size)
+            self._thread_buffers.stream = buffer
+        return buffer
+    
+    def _download_with_stream(self, remote_path, local_path, file_info):
+        """使用流式讀取下載文件，重用緩衝區避免每塊重新分配"""
+        chunk_size = self.stream_chunk_size
+        downloaded_size = 0
+        total_size = file_info.get('size', 0) if file_info else 0
+        
+        with self.safe_open_file(remote_path, 'rb') as remote_file:
+            fd = self._open_local(local_path)
+            try:
+                # 內容已一次性讀入記憶體，直接整體寫入
+                if isinstance(remote_file, BytesIO):
+                    with remote_file.getbuffer() as data:
+                        self._write_all(fd, data)
+                else:
+                    buffer = self._stream_buffer()
+                    view = memoryview(buffer)
+                    readinto = getattr(remote_file, 'readinto', None)
+                    
+                    while not self.is_stopped():
+                        with self._afc_sem:
+                            if readinto is not None:
+                                size = readinto(buffer)
+                                chunk = view[:size or 0]
+                            else:
+                                chunk = remote_file.read(chunk_size)
+                                size = len(chunk)
+                        if not size:
+                            break
+                        self._write_all(fd, chunk)
+                        downloaded_size += size
+                        
+                        # 大文件顯示進度
+                        if total_size > 5 * 1024 * 1024 and self.progress_due(downloaded_size, total_size):  # 大於5MB
+                            progress = (downloaded_size / total_size * 100) if total_size > 0 else 0
+                            self.update_progress(
+                                downloaded_size, total_size, 
+                                f"下載: {os.path.basename(local_path)[:20]}... ({progress:.1f}%)"
+                            )
+            finally:
+                self._close_local(fd)
         
         if self.is_stopped():
             if os.path.exists(local_path):
@@ -593,82 +1646,252 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
     
     def _download_with_bulk_read(self, remote_path, local_path, file_info):
         """使用一次性讀取下載文件"""
-        if hasattr(self.afc, 'get_file_contents'):
-            data = self.afc.get_file_contents(remote_path)
+        if self._afc_bulk is not None:
+            with self._afc_sem:
+                data = self._afc_bulk(self.afc, remote_path)
             
             if self.is_stopped():
                 return False
             
-            with open(local_path, 'wb') as local_file:
-                local_file.write(data)
+            fd = self._open_local(local_path)
+            try:
+                self._write_all(fd, data)
+            finally:
+                self._close_local(fd)
             
             return True
         else:
             raise AttributeError("AFC不支援批量讀取")
     
     def _download_with_pull(self, remote_path, local_path, file_info):
-        """使用pull_file方法下載（如果可用）"""
-        if hasattr(self.afc, 'pull_file'):
-            self.afc.pull_file(remote_path, local_path)
-            return not self.is_stopped()
-        elif hasattr(self.afc, 'pull'):
-            self.afc.pull(remote_path, local_path)
+        """使用pull_file或pull方法下載（如果可用）
+        
+        一般pull直接寫入local_path並返回None；部分版本改為返回存放內容的
+        臨時文件對象，此時在內核中複製到本地文件，資料不經過Python。
+        整數返回值可能是寫入的位元組數，不當作文件描述符處理。
+        """
+        if self._afc_pull is not None:
+            with self._afc_sem:
+                result = self._afc_pull(self.afc, remote_path, local_path)
+            if hasattr(result, 'fileno'):
+                self._copy_pulled(result, local_path)
             return not self.is_stopped()
         else:
             raise AttributeError("AFC不支援pull操作")
     
-    def download_photos_batch_safe(self, photos_info, output_directory="./iphone_photos"):
-        """安全的批量下載"""
+    def _copy_pulled(self, source, local_path):
+        """將pull返回的文件對象從頭複製到local_path，完成後關閉它"""
+        try:
+            if hasattr(source, 'flush'):
+                source.flush()
+            src_fd = source.fileno()
+            os.lseek(src_fd, 0, os.SEEK_SET)
+            
+            dst_fd = self._open_local(local_path)
+            try:
+                self._copy_fd(src_fd, dst_fd)
+            finally:
+                self._close_local(dst_fd)
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+    
+    @classmethod
+    def _copy_fd(cls, src_fd, dst_fd):
+        """從src_fd目前位置複製到EOF，優先copy_file_range，其次sendfile
+        
+        三種方式都使用並推進兩個描述符的文件位置，前一種中途失敗
+        （跨文件系統、不支援的文件類型等）時下一種從斷點繼續。
+        """
+        if _copy_file_range is not None:
+            try:
+                while _copy_file_range(src_fd, dst_fd, AFC_CHUNK):
+                    pass
+                return
+            except OSError:
+                pass
+        if _sendfile is not None:
+            try:
+                while _sendfile(dst_fd, src_fd, None, AFC_CHUNK):
+                    pass
+                return
+            except OSError:
+                pass
+        while True:
+            data = os.read(src_fd, AFC_CHUNK)
+            if not data:
+                return
+            cls._write_all(dst_fd, data)
+    
+    async def download_photos_batch_safe(self, photos_info, output_directory="./iphone_photos"):
+        """安全的批量下載，以asyncio排程有限數量的並行下載"""
         if not photos_info:
             logger.warning("沒有照片需要下載")
             return 0, 0
         
         total_photos = len(photos_info)
-        downloaded_count = 0
-        failed_count = 0
+        counts = {'downloaded': 0, 'failed': 0}
         
         logger.info(f"開始下載 {total_photos} 個文件...")
         self.update_progress(0, total_photos, "準備下載...")
         
-        # 順序下載而非並行，提高穩定性
-        for i, photo_info in enumerate(photos_info):
+        # 目標目錄在建立任務前一次建好，下載時不再逐個文件makedirs
+        self._prepare_local_dirs(photos_info, output_directory)
+        
+        # 有tqdm時由進度條在任務完成時更新，單一文件的進度回調暫停，避免兩者爭用終端
+        progress_bar = None
+        saved_callback = self.progress_callback
+        if tqdm is not None:
+            progress_bar = tqdm(total=total_photos, unit='file', desc='下載', dynamic_ncols=True)
+            self.progress_callback = None
+        
+        # 先取得併發許可再建立任務，同時進行中的任務不超過download_concurrency個；
+        # 照片信息逐筆從迭代器取出，記憶體不隨文件數增長。AFC請求另由self._afc_sem限流
+        semaphore = asyncio.Semaphore(self.download_concurrency)
+        pool = self._download_pool()
+        
+        # 收到停止請求時完成的future，各任務同時等待它和自己的下載
+        loop = asyncio.get_running_loop()
+        stop_future = loop.create_future()
+        
+        def set_stopped():
+            if not stop_future.done():
+                stop_future.set_result(None)
+        
+        self._stop_waker = lambda: loop.call_soon_threadsafe(set_stopped)
+        if self.is_stopped():
+            set_stopped()
+        
+        # 中斷時已在線程中執行、任務不再等待的下載
+        abandoned = []
+        
+        try:
+            async with _TaskGroup() as tg:
+                for photo_info in photos_info:
+                    # 已下載過的文件不建立任務，不產生任何USB傳輸
+                    if self._skip_downloaded(photo_info, output_directory):
+                        if progress_bar is not None:
+                            progress_bar.update(1)
+                        continue
+                    
+                    await semaphore.acquire()
+                    if self.is_stopped():
+                        semaphore.release()
+                        logger.info("🛑 下載已中斷")
+                        break
+                    tg.create_task(self._download_one(photo_info, output_directory, pool, semaphore, stop_future,
+                                                      counts, total_photos, progress_bar, abandoned))
+        except asyncio.CancelledError:
+            # 協程被取消時線程池中的下載不會自動停止，設置停止標誌讓它們在下一塊結束
+            self.should_stop.set()
+            raise
+        finally:
+            self._stop_waker = None
+            if progress_bar is not None:
+                progress_bar.close()
+                self.progress_callback = saved_callback
+        
+        # 被放棄的下載讀完當前一塊就會停下；等它們結束後才返回，
+        # 否則呼叫者清除停止標誌後它們會下載完成並寫入記錄，卻不計入本次結果
+        if abandoned:
+            await asyncio.wait(abandoned)
+        
+        self._close_worker_afc()
+        return counts['downloaded'], counts['failed']
+    
+    async def _download_one(self, photo_info, output_directory, pool, semaphore, stop_future, counts,
+                            total_photos, progress_bar=None, abandoned=None):
+        """在執行緒中下載單一文件，完成後釋放併發許可並更新計數
+        
+        收到停止請求時不等待線程中的下載結束：尚未開始的工作直接取消，
+        已開始的會在讀完當前一塊後關閉遠端文件並刪除不完整的本地文件，
+        其future加入abandoned，由批量下載在返回前統一等待。
+        """
+        try:
+            # 中斷後尚未開始的任務直接跳過
             if self.is_stopped():
-                logger.info("🛑 下載已中斷")
-                break
+                return
             
             relative_path = photo_info['path'].lstrip('/')
             local_path = os.path.join(output_directory, relative_path)
             
-            # 顯示當前下載進度
-            self.update_progress(
-                i, total_photos, 
-                f"下載中: {os.path.basename(photo_info['path'])[:30]}..."
-            )
+            # AFC客戶端是同步的，交給專用線程池處理，事件循環繼續排程其他下載
+            work = pool.submit(self.download_file_safe, photo_info['path'], local_path, photo_info)
+            future = asyncio.wrap_future(work)
+            await asyncio.wait((future, stop_future), return_when=asyncio.FIRST_COMPLETED)
+            if not future.done():
+                # 尚未開始的直接取消；已在執行的無法取消，交給呼叫者等待
+                if not work.cancel() and abandoned is not None:
+                    abandoned.append(future)
+                return
             
-            if self.download_file_safe(photo_info['path'], local_path, photo_info):
-                downloaded_count += 1
-            else:
-                failed_count += 1
-            
-            # 每10個文件顯示一次總進度
-            if (i + 1) % 10 == 0:
-                completed = downloaded_count + failed_count
-                success_rate = (downloaded_count / completed * 100) if completed > 0 else 0
-                logger.info(f"進度: {completed}/{total_photos} (成功率: {success_rate:.1f}%)")
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"✗ 下載任務失敗 {os.path.basename(photo_info['path'])}: {e}")
+                result = False
+        finally:
+            semaphore.release()
+        
+        # 計數只在事件循環執行緒中更新，不需要額外加鎖
+        if result:
+            counts['downloaded'] += 1
+        else:
+            counts['failed'] += 1
+            if not self.is_stopped():
+                self._failures.append(photo_info['path'])
+        
+        if progress_bar is not None:
+            progress_bar.update(1)
+            return
+        
+        completed = counts['downloaded'] + counts['failed']
+        self.update_progress(
+            completed, total_photos,
+            f"已完成: {os.path.basename(photo_info['path'])[:30]}..."
+        )
         
-        return downloaded_count, failed_count
+        # 每10個文件顯示一次總進度
+        if completed % 10 == 0 and logger.isEnabledFor(logging.INFO):
+            success_rate = counts['downloaded'] / completed * 100
+            logger.info(f"進度: {completed}/{total_photos} (成功率: {success_rate:.1f}%)")
     
-    def analyze_photos_safe(self):
-        """安全的照片分析"""
-        self.reset()
+    def analyze_photos_safe(self, on_found=None):
+        """安全的照片分析，on_found會收到掃描中找到的每個文件信息"""
+        self.reset_counters()
+        
+        self._listdir_cache = OrderedDict()
+        self._stat_cache = OrderedDict()
+        try:
+            return self._analyze_photos(on_found)
+        finally:
+            self._listdir_cache = None
+            self._stat_cache = None
+    
+    def _ensure_connection(self):
+        """確保lockdown會話和AFC服務可用
+        
+        重新分析時沿用現有連接，只以一次目錄列表確認連接仍然有效，
+        避免每次重新配對和啟動服務；連接失效時才關閉並重新建立。
+        """
+        if self._afc_main is not None and self.lockdown is not None:
+            if self._listdir_uncached('/') is not None:
+                logger.info("✓ 重用現有的設備連接")
+                return True
+            logger.info("現有連接已失效，重新連接設備...")
+            self.reset_connection()
         
         if not self.connect_device():
-            return None
+            return False
         
         if self.is_stopped():
-            return None
+            return False
         
-        if not self.setup_afc_service():
+        return self.setup_afc_service()
+    
+    def _analyze_photos(self, on_found=None):
+        """連接設備並掃描照片庫，已有可用的連接時直接重用"""
+        if not self._ensure_connection():
             return None
         
         if self.is_stopped():
@@ -688,10 +1911,17 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             logger.warning("未找到任何可訪問的照片目錄")
             return None
         
-        # 掃描所有照片
-        all_photos = []
+        # 掃描所有照片，掃描線程找到的文件直接寫入暫存文件，不在記憶體中累積
+        all_photos = PhotoCatalog(self.scan_spool_path)
+        catalog_lock = threading.Lock()
         self.scan_progress = {"current": 0, "total": 0, "message": "掃描中..."}
         
+        def collect(photo_info):
+            with catalog_lock:
+                all_photos.append(photo_info)
+            if on_found is not None:
+                on_found(photo_info)
+        
         for i, directory in enumerate(directories):
             if self.is_stopped():
                 logger.info("🛑 目錄掃描已中斷")
@@ -700,29 +1930,13 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
             logger.info(f"掃描目錄: {directory} ({i+1}/{len(directories)})")
             self.update_progress(i * 50, len(directories) * 50, f"掃描目錄: {directory}")
             
-            photos = self.scan_photos_safe(directory)
+            # 掃描時已取得文件信息，無需再逐一stat
+            self.scan_photos_safe(directory, on_found=collect)
             
             if self.is_stopped():
                 break
-            
-            # 順序獲取文件信息（避免並行造成的穩定性問題）
-            if photos:
-                logger.info(f"獲取 {len(photos)} 個文件的詳細信息...")
-                
-                for j, photo in enumerate(photos):
-                    if self.is_stopped():
-                        break
-                    
-                    photo_info = self.get_file_info_safe(photo)
-                    if photo_info:
-                        all_photos.append(photo_info)
-                    
-                    # 每50個文件更新進度
-                    if (j + 1) % 50 == 0:
-                        self.update_progress(
-                            j + 1, len(photos),
-                            f"已處理 {j + 1}/{len(photos)} 個文件"
-                        )
+        
+        all_photos.close()
         
         if self.is_stopped():
             logger.info("🛑 照片庫分析已中斷")
@@ -732,16 +1946,18 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
         
         # 統計分析
         if all_photos:
-            total_size = sum(p['size'] for p in all_photos)
-            image_count = len([p for p in all_photos if p['type'] == 'image'])
-            video_count = len([p for p in all_photos if p['type'] == 'video'])
+            total_size = all_photos.total_size
+            image_count = all_photos.count_type('image')
+            video_count = all_photos.count_type('video')
             
             analysis = {
                 'total_files': len(all_photos),
                 'image_count': image_count,
                 'video_count': video_count,
                 'total_size_mb': total_size / (1024 * 1024),
-                'photos_info': all_photos
+                'photos_info': all_photos,
+                'images': all_photos.select('image'),
+                'videos': all_photos.select('video')
             }
             
             self.update_progress(100, 100, "分析完成")
@@ -755,32 +1971,212 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
         logger.warning("未找到任何媒體文件")
         return None
     
-    def interactive_download_safe(self):
-        """安全的互動式下載介面"""
-        print("\n💡 使用提示: 操作過程中隨時按 Ctrl+C 可以中斷操作")
-        print("🔧 此版本針對穩定性進行優化，使用順序處理模式\n")
+    def scan_and_download_safe(self, output_directory="./iphone_photos"):
+        """邊掃描邊下載：掃描到的文件立即交給下載線程，不必等整個照片庫分析完成
+        
+        返回 (analysis, 成功數, 失敗數)。大文件和小文件使用不同隊列，
+        一個下載線程優先處理大文件，其餘優先處理小文件，避免大影片拖住大量小照片。
+        """
+        small_queue = queue.Queue(maxsize=1024)
+        large_queue = queue.Queue(maxsize=1024)
+        scan_done = threading.Event()
+        counts = {'downloaded': 0, 'failed': 0}
+        counts_lock = threading.Lock()
+        
+        def enqueue(photo_info):
+            if self._skip_downloaded(photo_info, output_directory):
+                return
+            target = large_queue if photo_info['size'] >= self.large_file_threshold else small_queue
+            # 隊列已滿時等待下載線程消化，中斷後放棄
+            while not self.is_stopped():
+                try:
+                    target.put(photo_info, timeout=0.2)
+                    return
+                except queue.Full:
+                    continue
         
-        def progress_callback(current, total, message):
-            if total > 0:
-                percentage = (current / total) * 100
-                print(f"\r⏳ {message} [{current}/{total}] {percentage:.1f}%", end='', flush=True)
+        def next_photo(preferred, other):
+            while not self.is_stopped():
+                try:
+                    return preferred.get(timeout=0.2)
+                except queue.Empty:
+                    pass
+                try:
+                    return other.get_nowait()
+                except queue.Empty:
+                    pass
+                if scan_done.is_set() and small_queue.empty() and large_queue.empty():
+                    break
+            return None
+        
+        def downloader(prefer_large):
+            preferred, other = (large_queue, small_queue) if prefer_large else (small_queue, large_queue)
+            while True:
+                photo_info = next_photo(preferred, other)
+                if photo_info is None:
+                    return
+                
+                local_path = os.path.join(output_directory, photo_info['path'].lstrip('/'))
+                try:
+                    success = self.download_file_safe(photo_info['path'], local_path, photo_info)
+                except Exception as e:
+                    logger.error(f"✗ 下載任務失敗 {os.path.basename(photo_info['path'])}: {e}")
+                    success = False
+                
+                with counts_lock:
+                    counts['downloaded' if success else 'failed'] += 1
+                    completed = counts['downloaded'] + counts['failed']
+                    if not success and not self.is_stopped():
+                        self._failures.append(photo_info['path'])
+                
+                if completed % 10 == 0 and logger.isEnabledFor(logging.INFO):
+                    logger.info(f"已下載 {counts['downloaded']} 個文件，失敗 {counts['failed']} 個")
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for i in range(self.max_workers):
+                executor.submit(downloader, i == 0)
+            try:
+                analysis = self.analyze_photos_safe(on_found=enqueue)
+            finally:
+                scan_done.set()
+        
+        self._close_worker_afc()
+        return analysis, counts['downloaded'], counts['failed']
+    
+    def _print_progress(self, current, total, message):
+        """在終端顯示進度"""
+        self._announce_stop()
+        if total > 0:
+            percentage = (current / total) * 100
+            print(f"\r⏳ {message} [{current}/{total}] {percentage:.1f}%", end='', flush=True)
+        else:
+            print(f"\r⏳ {message}", end='', flush=True)
+    
+    def _print_summary(self, downloaded, failed, elapsed, interrupted, banner=None):
+        """輸出下載統計和失敗文件列表"""
+        if banner is None:
+            banner = "\n\n🛑 下載已中斷!" if interrupted else "\n\n🎉 下載完成!"
+        
+        parts = [_SUMMARY_TMPL.format(banner=banner, d=downloaded, f=failed, e=elapsed)]
+        if failed and not interrupted:
+            parts.append(_FAILURE_HINT_TMPL.format(f=failed))
+        if self.skipped_count:
+            parts.append(_SKIPPED_TMPL.format(n=self.skipped_count))
+        sys.stdout.write("".join(parts))
+        
+        self._print_failures()
+    
+    def _print_failures(self, limit=20):
+        """列出下載失敗的文件，整段一次輸出"""
+        if not self._failures:
+            return
+        
+        lines = [f"\n✗ 下載失敗的文件 ({len(self._failures)} 個):"]
+        lines.extend(f"   - {path}" for path in self._failures[:limit])
+        if len(self._failures) > limit:
+            lines.append(f"   ... 另有 {len(self._failures) - limit} 個，詳見日誌文件")
+        print("\n".join(lines))
+    
+    def download_all_safe(self, output_directory="./iphone_photos", position=None):
+        """非互動模式：邊掃描邊下載所有媒體文件
+        
+        position不為None時表示與其他設備同時下載：不輸出提示，
+        進度顯示在第position行的進度條上（需要tqdm），統計標題加上設備名稱。
+        """
+        progress_bar = None
+        if position is None:
+            _emit(_MSG_TIP)
+            print(f"🚀 邊掃描邊下載所有媒體文件到: {output_directory}\n")
+            self.set_progress_callback(self._print_progress)
+        elif tqdm is not None:
+            progress_bar = tqdm(total=0, position=position, desc=self.udid, dynamic_ncols=True, leave=True)
+            self.set_progress_callback(lambda current, total, message: self._update_device_bar(progress_bar, current, total))
+        
+        try:
+            start_ns = time.perf_counter_ns()
+            analysis, downloaded, failed = self.scan_and_download_safe(output_directory)
+            self._announce_stop()
+            elapsed_time = (time.perf_counter_ns() - start_ns) / 1e9
+        finally:
+            if progress_bar is not None:
+                progress_bar.close()
+        
+        banner = None
+        if analysis is None and not self.is_stopped():
+            banner = "\n❌ 無法分析照片庫或未找到媒體文件"
+        if position is not None:
+            device = f"📱 {self.device_info.get('name', 'Unknown')} ({self.udid})"
+            if banner is None:
+                banner = f"\n\n{device} " + ("🛑 下載已中斷!" if self.is_stopped() else "🎉 下載完成!")
+            else:
+                banner = f"\n{device}{banner}"
+        self._print_summary(downloaded, failed, elapsed_time, self.is_stopped(), banner)
+    
+    def _update_device_bar(self, progress_bar, current, total):
+        """多設備下載時的進度回調：各階段的總數不同，直接改寫進度條的數值"""
+        progress_bar.total = total
+        progress_bar.n = current
+        if self.device_info:
+            progress_bar.set_description_str(self.device_info['name'], refresh=False)
+        progress_bar.refresh()
+    
+    async def _ainput(self, prompt):
+        """在背景線程讀取使用者輸入，等待期間事件循環不被阻塞
+        
+        按Ctrl+C時不必等使用者按Enter，直接拋出KeyboardInterrupt。
+        讀取線程設為daemon，直接從無緩衝的stdin讀取：被放棄的讀取不持有
+        sys.stdin的鎖，程式結束時不會卡住。
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        stdin = sys.stdin
+        
+        def resolve(setter, value):
+            if not future.done():
+                setter(value)
+        
+        def read_line():
+            try:
+                data = stdin.buffer.raw.readline()
+                if not data:
+                    raise EOFError
+                line = data.decode(stdin.encoding or 'utf-8', errors='replace').rstrip('\r\n')
+            except Exception as e:
+                callback = (resolve, future.set_exception, e)
             else:
-                print(f"\r⏳ {message}", end='', flush=True)
+                callback = (resolve, future.set_result, line)
+            try:
+                loop.call_soon_threadsafe(*callback)
+            except RuntimeError:
+                pass  # 事件循環已結束
+        
+        print(prompt, end='', flush=True)
+        threading.Thread(target=read_line, name="stdin", daemon=True).start()
+        
+        while not self.is_stopped():
+            done, _ = await asyncio.wait({future}, timeout=0.2)
+            if done:
+                return future.result()
         
-        self.set_progress_callback(progress_callback)
+        future.cancel()
+        raise KeyboardInterrupt
+    
+    async def interactive_download_safe(self):
+        """安全的互動式下載介面"""
+        _emit(_MSG_TIP)
+        _emit(_MSG_PARALLEL)
         
-        print("🔍 開始分析iPhone照片庫...")
+        self.set_progress_callback(self._print_progress)
+        
+        _emit(_MSG_ANALYZING)
         analysis = self.analyze_photos_safe()
+        self._announce_stop()
         
         if not analysis:
             if self.is_stopped():
-                print("\n🛑 分析已中斷")
+                _emit(_MSG_ANALYSIS_STOPPED)
             else:
-                print("\n❌ 無法分析照片庫或未找到媒體文件")
-                print("建議:")
-                print("1. 確認iPhone上有照片")
-                print("2. 檢查iPhone信任設定")
-                print("3. 嘗試重新連接設備")
+                _emit(_MSG_NO_MEDIA)
             return
         
         print(f"\n\n📱 發現 {analysis['total_files']} 個媒體文件")
@@ -790,31 +2186,28 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
         
         while True:
             if self.is_stopped():
-                print("\n🛑 操作已中斷")
+                self._announce_stop()
+                _emit(_MSG_OP_STOPPED)
                 break
                 
-            print("\n選擇下載選項:")
-            print("1. 下載所有文件")
-            print("2. 只下載照片")
-            print("3. 只下載影片")
-            print("4. 重新分析")
-            print("5. 退出")
+            _emit(_MSG_MENU)
             
             try:
-                choice = input("\n請選擇 (1-5): ").strip()
-            except (KeyboardInterrupt, EOFError):
-                print("\n🛑 操作已中斷")
+                choice = (await self._ainput("\n請選擇 (1-5): ")).strip()
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+                _emit(_MSG_OP_STOPPED)
                 break
             
             if choice == '1':
                 photos_to_download = analysis['photos_info']
             elif choice == '2':
-                photos_to_download = [p for p in analysis['photos_info'] if p['type'] == 'image']
+                photos_to_download = analysis['images']
             elif choice == '3':
-                photos_to_download = [p for p in analysis['photos_info'] if p['type'] == 'video']
+                photos_to_download = analysis['videos']
             elif choice == '4':
-                print("\n🔄 重新分析照片庫...")
+                _emit(_MSG_REANALYZING)
                 analysis = self.analyze_photos_safe()
+                self._announce_stop()
                 if not analysis:
                     print("❌ 重新分析失敗")
                 continue
@@ -829,73 +2222,119 @@ class SafeiPhonePhotoReader(InterruptibleOperation):
                 continue
             
             try:
-                output_dir = input(f"輸出目錄 (預設: ./iphone_photos): ").strip()
+                output_dir = (await self._ainput("輸出目錄 (預設: ./iphone_photos): ")).strip()
                 if not output_dir:
                     output_dir = "./iphone_photos"
-            except (KeyboardInterrupt, EOFError):
-                print("\n🛑 操作已中斷")
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+                _emit(_MSG_OP_STOPPED)
                 break
             
             print(f"\n🚀 開始下載 {len(photos_to_download)} 個文件...")
-            print("💡 按 Ctrl+C 可隨時中斷下載")
-            print("⚠️  使用穩定模式，速度較慢但更可靠")
+            _emit(_MSG_DOWNLOAD_TIP)
+            print(f"⚡ 並行下載模式，最多同時下載 {self.download_concurrency} 個文件")
             
-            start_time = time.time()
-            self.reset()
+            start_ns = time.perf_counter_ns()
+            self.reset_counters()
             
-            downloaded, failed = self.download_photos_batch_safe(photos_to_download, output_dir)
+            downloaded, failed = await self.download_photos_batch_safe(photos_to_download, output_dir)
+            self._announce_stop()
             
-            elapsed_time = time.time() - start_time
+            elapsed_time = (time.perf_counter_ns() - start_ns) / 1e9
             
-            if self.is_stopped():
-                print(f"\n\n🛑 下載已中斷!")
-                print(f"✓ 已完成: {downloaded} 個文件")
-                print(f"✗ 失敗: {failed} 個文件")
-                print(f"⏱ 耗時: {elapsed_time:.1f} 秒")
-            else:
-                print(f"\n\n🎉 下載完成!")
-                print(f"✓ 成功: {downloaded} 個文件")
-                print(f"✗ 失敗: {failed} 個文件")
-                print(f"⏱ 耗時: {elapsed_time:.1f} 秒")
-                
-                if failed > 0:
-                    print(f"💡 有 {failed} 個文件下載失敗，可能原因:")
-                    print("   - 文件被系統保護")
-                    print("   - 網路連接問題") 
-                    print("   - 存儲空間不足")
+            self._print_summary(downloaded, failed, elapsed_time, self.is_stopped())
+            
+            # 中斷的只是這一批下載，清除停止狀態後才詢問；
+            # 否則_ainput看到仍在的停止標誌會直接結束整個程式
+            self.reset_counters()
             
             try:
-                continue_choice = input("\n是否繼續其他操作? (y/n): ").strip().lower()
+                continue_choice = (await self._ainput("\n是否繼續其他操作? (y/n): ")).strip().lower()
                 if continue_choice != 'y':
                     break
-            except (KeyboardInterrupt, EOFError):
-                print("\n🛑 操作已中斷")
+            except (KeyboardInterrupt, EOFError, asyncio.CancelledError):
+                _emit(_MSG_OP_STOPPED)
                 break
-            
-            self.reset()
+
+def download_all_devices(udids, output_directory, force=False):
+    """同時從多台設備下載，每台設備一個讀取器，下載到各自以UDID命名的子目錄
+    
+    每個讀取器有自己的AFC連接和線程池，互不阻塞；下載記錄共用一份。
+    Ctrl+C由這裡統一處理，轉發給所有讀取器。
+    """
+    manifest = DownloadManifest(_MANIFEST_PATH)
+    readers = [SafeiPhonePhotoReader(udid=udid, manifest=manifest, handle_sigint=False) for udid in udids]
+    
+    def forward_sigint(signum, frame):
+        for reader in readers:
+            reader._signal_handler(signum, frame)
+    
+    signal.signal(signal.SIGINT, forward_sigint)
+    print(f"📱 找到 {len(readers)} 台設備，同時下載到: {output_directory}\n")
+    
+    async def run_all():
+        await asyncio.gather(*(
+            asyncio.to_thread(reader.download_all_safe, os.path.join(output_directory, reader.udid), position=i)
+            for i, reader in enumerate(readers)
+        ))
+    
+    try:
+        with ExitStack() as stack:
+            for reader in readers:
+                reader.force_download = force
+                stack.enter_context(reader)
+            asyncio.run(run_all())
+    finally:
+        try:
+            manifest.close()
+        except Exception as e:
+            logger.error(f"保存下載記錄失敗: {e}")
 
 def main():
     """主程式"""
-    print("🍎 iPhone 15 Pro Max 照片讀取程式 (穩定版)")
-    print("🔧 專為iOS 18.5優化，修正模組相容性問題")
-    print("=" * 60)
+    parser = argparse.ArgumentParser(description="iPhone照片讀取程式")
+    parser.add_argument('--download-all', metavar='OUTPUT_DIR',
+                        help="不進入選單，邊掃描邊下載所有媒體文件到指定目錄")
+    parser.add_argument('--force', action='store_true',
+                        help="忽略下載記錄，重新下載所有文件")
+    parser.add_argument('--concurrency', type=int, default=16, metavar='N',
+                        help="互動模式下同時進行的下載數 (預設: 16)")
+    args = parser.parse_args()
+    
+    _emit(_MSG_BANNER)
     
-    reader = SafeiPhonePhotoReader()
+    # 非互動模式下連接了多台設備時同時下載；互動選單需要讀取輸入，只操作一台設備
+    udids = []
+    if args.download_all:
+        try:
+            # 開啟Wi-Fi同步的設備會以USB和網路各出現一次，同一UDID只保留一個
+            udids = list(dict.fromkeys(device.serial for device in usbmux.list_devices()))
+        except Exception as e:
+            logger.warning("列出設備失敗，只連接一台設備: %s", e)
     
     try:
-        reader.interactive_download_safe()
-    except KeyboardInterrupt:
-        print("\n\n🛑 程式已中斷")
-        print("感謝使用!")
-    except Exception as e:
-        logger.error(f"程式執行錯誤: {e}")
-        print(f"\n❌ 發生錯誤: {e}")
-        print("請檢查日誌文件: iphone_reader.log")
-        print("\n故障排除建議:")
-        print("1. 確認iPhone已連接並信任此電腦")
-        print("2. 嘗試重新啟動iPhone和電腦")
-        print("3. 更新pymobiledevice3: pip install --upgrade pymobiledevice3")
-        print("4. 檢查USB線和連接埠")
+        try:
+            if len(udids) > 1:
+                download_all_devices(udids, args.download_all, args.force)
+            else:
+                with SafeiPhonePhotoReader() as reader:
+                    reader.download_concurrency = max(1, args.concurrency)
+                    reader.force_download = args.force
+                    
+                    if args.download_all:
+                        reader.download_all_safe(args.download_all)
+                    else:
+                        if uvloop is not None:
+                            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+                        asyncio.run(reader.interactive_download_safe())
+        except KeyboardInterrupt:
+            _emit(_MSG_PROGRAM_STOPPED)
+        except Exception as e:
+            logger.error(f"程式執行錯誤: {e}")
+            print(f"\n❌ 發生錯誤: {e}")
+            _emit(_MSG_TROUBLESHOOT)
+    finally:
+        # 寫出隊列中剩餘的日誌
+        _log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file